@@ -1,16 +1,20 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import routes
 from app.routes.process_chunks import router as process_chunks_router
 from app.routes.chat import router as chat_router
 from app.routes.embeddings import router as embeddings_router
+from app.utils.clients import create_openai_client, create_supabase_client, create_docling_pool, create_answer_cache
+from app.utils.config import SEMANTIC_CACHE_PATH
 
 # Create FastAPI app
 app = FastAPI(
     title="Document Processing API",
     description="API for processing documents and creating embeddings",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -22,6 +26,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Create shared clients, the Docling pool and the answer cache once for the lifetime of the app
+@app.on_event("startup")
+async def startup():
+    app.state.openai = create_openai_client()
+    app.state.supabase = create_supabase_client()
+    app.state.docling_pool = create_docling_pool()
+    app.state.answer_cache = create_answer_cache()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.openai.close()
+    app.state.docling_pool.shutdown(wait=False, cancel_futures=True)
+    app.state.answer_cache.save(SEMANTIC_CACHE_PATH)
+
+
 # Include routers
 app.include_router(process_chunks_router, prefix="/api", tags=["Document Processing"])
 app.include_router(chat_router, prefix="/api/chat", tags=["Chat"])
@@ -1,27 +1,26 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import openai
 import numpy as np
-from supabase import create_client, Client
+import orjson
+from supabase import Client
 import os
 
-from app.utils.config import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_ANON_KEY
+from app.utils.clients import get_openai_client, get_supabase_client, get_answer_cache, sb
+from app.utils.config import SEMANTIC_CACHE_THRESHOLD
+from app.utils.semantic_cache import SemanticCache
 from app.utils.text_processing import create_embedding
 
 router = APIRouter()
 
-# Create OpenAI client
-openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-
 class ChatRequest(BaseModel):
     query: str
     workspace_id: str
     user_id: Optional[str] = None
-    max_context_chunks: Optional[int] = 10
+    max_context_chunks: Optional[int] = Field(10, ge=1, le=10)
 
 class MediaContext(BaseModel):
     media_id: str
@@ -34,13 +33,14 @@ class ChatResponse(BaseModel):
     answer: str
     context_sources: List[MediaContext]
 
-# Function to match documents using cosine distance
-async def match_documents(query_embedding, match_threshold=0.35, match_count=20):
-    result = supabase.rpc("match_chunks", {
+# Function to match documents in a workspace using cosine distance
+async def match_documents(supabase: Client, query_embedding, workspace_id, match_threshold=0.35, match_count=10):
+    result = await sb(lambda: supabase.rpc("match_chunks", {
         "query_embedding": query_embedding,
         "match_threshold": match_threshold,
-        "match_count": match_count
-    }).execute()
+        "match_count": match_count,
+        "p_workspace_id": workspace_id
+    }).execute())
 
     print(f"Match documents result: {result}")
     
@@ -50,101 +50,7 @@ async def match_documents(query_embedding, match_threshold=0.35, match_count=20)
 
     return result.data
 
-@router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest, req: Request):
-    """
-    RAG-powered chat endpoint.
-    1. Vectorizes user query
-    2. Retrieves top 25 similar embeddings from the database
-    3. Filters to embeddings in the user's workspace
-    4. Uses top chunks as context for LLM generation
-    5. Returns answer and source information
-    """
-    try:
-        # Extract user_id from auth if not provided
-        user_id = request.user_id
-        if not user_id:
-            auth_header = req.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                # TODO: Extract user ID from token in a real implementation.
-                raise HTTPException(status_code=401, detail="User ID extraction not implemented")
-            else:
-                raise HTTPException(status_code=401, detail="Authentication required")
-
-        # 1. Create embedding for the query (do not modify this utility call)
-        query_embedding = await create_embedding(request.query, openai_client)
-        
-        # 2. Fetch top similar vector embeddings using the new match_documents function
-        vector_search_result = await match_documents(query_embedding)
-
-        print(f"Vector search result: {vector_search_result}")
-
-        # Check if the vector search result is empty
-        if not vector_search_result:
-            completion = await openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": request.query}
-                ]
-            )
-            return ChatResponse(
-                answer=completion.choices[0].message.content,
-                context_sources=[]
-            )
-                
-        # 3. Get all media IDs in the user's workspace.
-        workspace_media_result = supabase.from_("media_workspace_mapping").select("media_id").eq("workspace_id", request.workspace_id).execute()
-        
-        workspace_media_ids = [item['media_id'] for item in workspace_media_result.data] if workspace_media_result.data else []
-
-        print(f"Workspace media IDs: {workspace_media_ids}")
-
-        # If no media IDs found in the workspace, run the query through the LLM
-        if not workspace_media_ids:
-            completion = await openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": request.query}
-                ]
-            )
-            return ChatResponse(
-                answer=completion.choices[0].message.content,
-                context_sources=[]
-            )
-        
-        # Filter vector search results to only include media in the workspace
-        filtered_results = [
-            result for result in vector_search_result 
-            if result['media_id'] in workspace_media_ids
-        ]
-        filtered_results.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        # 4. Use the top chunks as context for LLM
-        max_chunks = min(10, len(filtered_results))  # Limit to a maximum of 10 chunks
-        top_chunks = filtered_results[:max_chunks]
-
-        print(f"Top chunks: {top_chunks}")
-        
-        # Build context from top chunks; adjust media name extraction since it is nested in 'media'
-        context = ""
-        context_sources = []
-        for chunk in top_chunks:
-            media_name = chunk.get('media', {}).get('name', 'Unknown')
-            context += f"\n\nContext from {media_name}:\n{chunk['chunk_text']}\n"
-            context_sources.append(MediaContext(
-                media_id=chunk['media_id'],
-                media_name=media_name,
-                chunk_id=chunk['id'],
-                chunk_text=chunk['chunk_text'],
-                similarity=chunk['similarity']
-            ))
-        
-        print(f"Context sources: {context_sources}")
-
-        # 5. Generate answer from LLM using the provided context
-        system_prompt = """
+SYSTEM_PROMPT = """
 You are a knowledgeable and helpful assistant. Use the provided context to answer user questions as accurately and thoroughly as possible.
 
 Guidelines:
@@ -156,8 +62,59 @@ Guidelines:
 
 The context you receive is a collection of documents related to the user's question.
 """
-        
-        user_prompt = f"""
+
+
+def check_user(request: ChatRequest, req: Request):
+    # Extract user_id from auth if not provided
+    if not request.user_id:
+        auth_header = req.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            # TODO: Extract user ID from token in a real implementation.
+            raise HTTPException(status_code=401, detail="User ID extraction not implemented")
+        else:
+            raise HTTPException(status_code=401, detail="Authentication required")
+
+
+async def build_messages(request: ChatRequest, query_embedding, supabase: Client):
+    """
+    Retrieve workspace context for the query and build the LLM messages.
+    Returns the messages and the context sources they were built from.
+    """
+    # Fetch top similar vector embeddings within the user's workspace
+    top_chunks = await match_documents(
+        supabase,
+        query_embedding,
+        request.workspace_id,
+        match_count=request.max_context_chunks or 10
+    )
+
+    print(f"Top chunks: {top_chunks}")
+
+    # If no chunks matched in the workspace, run the query through the LLM
+    if not top_chunks:
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": request.query}
+        ]
+        return messages, []
+    
+    # Build context from top chunks; adjust media name extraction since it is nested in 'media'
+    context = ""
+    context_sources = []
+    for chunk in top_chunks:
+        media_name = chunk.get('media', {}).get('name', 'Unknown')
+        context += f"\n\nContext from {media_name}:\n{chunk['chunk_text']}\n"
+        context_sources.append(MediaContext(
+            media_id=chunk['media_id'],
+            media_name=media_name,
+            chunk_id=chunk['id'],
+            chunk_text=chunk['chunk_text'],
+            similarity=chunk['similarity']
+        ))
+    
+    print(f"Context sources: {context_sources}")
+
+    user_prompt = f"""
             You are given a question and a set of context documents that may contain relevant information. Use the context to answer the question as accurately and completely as possible.
 
             If the context does not contain sufficient information, say so clearly. Do not make up information that is not supported by the context.
@@ -171,19 +128,122 @@ The context you receive is a collection of documents related to the user's quest
             {request.query}
 
             Answer:"""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, context_sources
+
+
+@router.post("/", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    req: Request,
+    openai_client: openai.AsyncOpenAI = Depends(get_openai_client),
+    supabase: Client = Depends(get_supabase_client),
+    answer_cache: SemanticCache = Depends(get_answer_cache)
+):
+    """
+    RAG-powered chat endpoint.
+    1. Vectorizes user query and returns a cached answer for similar queries
+    2. Retrieves the most similar embeddings in the user's workspace
+    3. Uses top chunks as context for LLM generation
+    4. Returns answer and source information
+    """
+    try:
+        check_user(request, req)
+
+        # 1. Create embedding for the query (do not modify this utility call)
+        query_embedding = await create_embedding(request.query, openai_client)
+        
+        # Return a cached answer if a similar question was asked in this workspace
+        cached_response = answer_cache.lookup(query_embedding, request.workspace_id, SEMANTIC_CACHE_THRESHOLD)
+        if cached_response is not None:
+            return ChatResponse(**cached_response)
+        
+        # 2. Fetch context and build the prompt
+        messages, context_sources = await build_messages(request, query_embedding, supabase)
+
+        # 3. Generate answer from LLM using the provided context
         completion = await openai_client.chat.completions.create(
             model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+            messages=messages
         )
         
-        # 6. Return the answer and source information
-        return ChatResponse(
+        # 4. Cache and return the answer and source information
+        response = ChatResponse(
             answer=completion.choices[0].message.content,
             context_sources=context_sources
         )
+        # Answers without context would keep hiding documents uploaded later
+        if context_sources:
+            answer_cache.add(query_embedding, request.workspace_id, jsonable_encoder(response))
+        return response
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    req: Request,
+    openai_client: openai.AsyncOpenAI = Depends(get_openai_client),
+    supabase: Client = Depends(get_supabase_client),
+    answer_cache: SemanticCache = Depends(get_answer_cache)
+):
+    """
+    Streaming variant of the chat endpoint.
+    Responds with newline-delimited JSON: first {"context_sources": [...]},
+    then one {"token": "..."} line per piece of the answer as it is generated.
+    """
+    try:
+        check_user(request, req)
+
+        query_embedding = await create_embedding(request.query, openai_client)
+        
+        cached_response = answer_cache.lookup(query_embedding, request.workspace_id, SEMANTIC_CACHE_THRESHOLD)
+        if cached_response is not None:
+            async def replay():
+                yield orjson.dumps({"context_sources": cached_response["context_sources"]}) + b"\n"
+                yield orjson.dumps({"token": cached_response["answer"]}) + b"\n"
+            return StreamingResponse(replay(), media_type="application/x-ndjson")
+        
+        messages, context_sources = await build_messages(request, query_embedding, supabase)
+        
+        stream = await openai_client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            stream=True
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def generate():
+        sources = jsonable_encoder(context_sources)
+        yield orjson.dumps({"context_sources": sources}) + b"\n"
+        
+        answer = []
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    answer.append(delta)
+                    yield orjson.dumps({"token": delta}) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+            return
+        finally:
+            # Release the upstream connection even if the client disconnected mid-stream
+            await stream.close()
+        
+        # Cache the full answer once generation completes, unless it had no context
+        if sources:
+            answer_cache.add(query_embedding, request.workspace_id, {
+                "answer": "".join(answer),
+                "context_sources": sources
+            })
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
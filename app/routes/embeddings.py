@@ -1,18 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 import openai
 from typing import List, Optional
-import numpy as np
-import json
+from supabase import Client
 
-from app.utils.config import OPENAI_API_KEY
-from app.utils.text_processing import create_embedding
+from app.utils.clients import get_openai_client, get_supabase_client, sb
+from app.utils.text_processing import create_embedding, create_embeddings
 
 router = APIRouter()
 
-# Create OpenAI client
-openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
-
 
 class SearchQuery(BaseModel):
     query: str
@@ -29,7 +25,11 @@ class SearchResult(BaseModel):
 
 
 @router.post("/search", response_model=List[SearchResult])
-async def search_embeddings(query: SearchQuery):
+async def search_embeddings(
+    query: SearchQuery,
+    openai_client: openai.AsyncOpenAI = Depends(get_openai_client),
+    supabase: Client = Depends(get_supabase_client)
+):
     """
     Search for similar text chunks using embeddings
     """
@@ -37,57 +37,38 @@ async def search_embeddings(query: SearchQuery):
         # Create embedding for the search query
         query_embedding = await create_embedding(query.query, openai_client)
         
-        # Convert query embedding to numpy array for similarity calculation
-        query_embedding_array = np.array(query_embedding)
-        
-        # Get all chunks with their embeddings
-        # Note: In a production environment, you'd want to implement this using
-        # a vector similarity search database like pgvector
-        from app.utils.config import supabase
-        chunks_result = supabase.table('chunks').select('*').execute()
+        # Similarity is computed in the database by the match_chunks RPC
+        chunks_result = await sb(lambda: supabase.rpc('match_chunks', {
+            'query_embedding': query_embedding,
+            'match_threshold': query.similarity_threshold,
+            'match_count': query.limit
+        }).execute())
         
         if not chunks_result.data:
             return []
         
-        # Calculate similarities and sort results
-        results = []
-        for chunk in chunks_result.data:
-            # Parse stored embedding back to list
-            chunk_embedding = json.loads(chunk['embedding'])
-            chunk_embedding_array = np.array(chunk_embedding)
-            
-            # Calculate cosine similarity
-            similarity = np.dot(query_embedding_array, chunk_embedding_array) / (
-                np.linalg.norm(query_embedding_array) * np.linalg.norm(chunk_embedding_array)
+        return [
+            SearchResult(
+                chunk_id=chunk['id'],
+                chunk_text=chunk['chunk_text'],
+                similarity=chunk['similarity'],
+                media_id=chunk['media_id'],
+                page_number=chunk.get('page_number')
             )
-            
-            if similarity >= query.similarity_threshold:
-                results.append(SearchResult(
-                    chunk_id=chunk['id'],
-                    chunk_text=chunk['chunk_text'],
-                    similarity=float(similarity),
-                    media_id=chunk['media_id'],
-                    page_number=chunk.get('page_number')
-                ))
-        
-        # Sort by similarity (highest first) and limit results
-        results.sort(key=lambda x: x.similarity, reverse=True)
-        return results[:query.limit]
+            for chunk in chunks_result.data
+        ]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/batch-embed")
-async def batch_embed_text(texts: List[str]):
+async def batch_embed_text(texts: List[str], openai_client: openai.AsyncOpenAI = Depends(get_openai_client)):
     """
     Create embeddings for multiple texts in one batch
     """
     try:
-        embeddings = []
-        for text in texts:
-            embedding = await create_embedding(text, openai_client)
-            embeddings.append(embedding)
+        embeddings = await create_embeddings(texts, openai_client)
             
         return {"success": True, "embeddings": embeddings}
         
@@ -2,22 +2,22 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, B
 from pydantic import BaseModel
 import os
 import openai
-from supabase import create_client, Client
+from supabase import Client
 import tempfile
+from concurrent.futures import Executor
 from typing import List, Optional, Dict, Any
 import uuid
-import json
+import orjson
 
-from app.utils.config import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_ANON_KEY, STORAGE_BUCKET
-from app.utils.text_processing import split_into_chunks, process_document_with_docling, create_embedding
+from app.utils.config import STORAGE_BUCKET, TEMP_FILES_DIR, CHUNK_INSERT_BATCH_SIZE
+from app.utils.clients import get_openai_client, get_supabase_client, get_docling_pool, get_answer_cache, sb
+from app.utils.semantic_cache import SemanticCache
+from app.utils.text_processing import split_into_chunks, process_document_with_docling, create_embeddings
 
 router = APIRouter()
 
-# Create OpenAI client
-openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Size of each read when streaming an upload to disk
+UPLOAD_READ_SIZE = 1 << 16
 
 
 class ChunkMetadata(BaseModel):
@@ -76,16 +76,120 @@ class ProcessChunkResponse(BaseModel):
     note: str
 
 
-# Background task function to process chunks
-async def background_process_chunks(file_name: str):
-    process_chunk_request = ProcessChunkRequest(fileName=file_name)
-    await process_chunks(process_chunk_request)
+async def _process_from_path(
+    local_path: str,
+    media_id: str,
+    file_ext: str,
+    openai_client: openai.AsyncOpenAI,
+    supabase: Client,
+    docling_pool: Executor
+) -> ProcessChunkResponse:
+    """
+    Process a document already on local disk into stored chunks and embeddings
+    """
+    # Process document using Docling
+    doc_result = await process_document_with_docling(local_path, file_ext, docling_pool)
+    
+    if "error" in doc_result:
+        raise HTTPException(status_code=500, detail=doc_result["error"])
+    
+    # Split text into chunks
+    chunks = split_into_chunks(doc_result["text"])
+    
+    # Create embeddings in batched requests
+    embeddings = await create_embeddings([chunk["text"] for chunk in chunks], openai_client)
+    
+    # Store chunks and embeddings in database with bulk inserts
+    rows = [
+        {
+            'chunk_text': chunk["text"],
+            'media_id': media_id,
+            'page_number': None,  # Set to None if not used
+            'embedding': embedding
+        }
+        for chunk, embedding in zip(chunks, embeddings)
+    ]
+    
+    # One insert per CHUNK_INSERT_BATCH_SIZE rows keeps request bodies bounded
+    inserted = []
+    for start in range(0, len(rows), CHUNK_INSERT_BATCH_SIZE):
+        batch = rows[start:start + CHUNK_INSERT_BATCH_SIZE]
+        chunk_result = await sb(lambda: supabase.table('chunks').insert(batch).execute())
+        
+        if not chunk_result.data or len(chunk_result.data) != len(batch):
+            raise HTTPException(status_code=500, detail="Failed to store chunks")
+        
+        inserted.extend(chunk_result.data)
+    
+    results = [
+        ChunkResult(
+            chunkId=row['id'],
+            pageNumber=row.get('page_number'),
+            metadata=ChunkMetadata(**chunk["metadata"])
+        )
+        for row, chunk in zip(inserted, chunks)
+    ]
+    
+    return ProcessChunkResponse(
+        success=True,
+        chunks=len(results),
+        results=results,
+        tables=[TableData(**table) for table in doc_result["tables"]],
+        figures=[FigureData(**figure) for figure in doc_result["figures"]],
+        structure=DocumentStructure(**doc_result["structure"]),
+        note="Document processed successfully with structure preservation"
+    )
+
+
+async def _media_workspace_ids(supabase: Client, media_id: str) -> List[str]:
+    """
+    Return the workspaces a media file is mapped into
+    """
+    result = await sb(lambda: supabase.table('media_workspace_mapping').select('workspace_id').eq('media_id', media_id).execute())
+    return [row['workspace_id'] for row in result.data or []]
+
+
+# Background task function to process an uploaded file from its local temp copy
+async def background_process_chunks(
+    storage_path: str,
+    local_path: str,
+    media_id: str,
+    workspace_id: str,
+    openai_client: openai.AsyncOpenAI,
+    supabase: Client,
+    docling_pool: Executor,
+    answer_cache: SemanticCache
+):
+    try:
+        file_ext = os.path.splitext(storage_path)[1].lower()[1:]
+        print(f"Processing file: {storage_path}")
+        await _process_from_path(local_path, media_id, file_ext, openai_client, supabase, docling_pool)
+    except Exception as e:
+        print(f"Error in background processing: {str(e)}")
+    finally:
+        # Cached answers for the workspace predate the new chunks
+        answer_cache.invalidate(workspace_id)
+        # Clean up temp file
+        print(f"Finished processing file: {storage_path}")
+        if os.path.exists(local_path):
+            os.unlink(local_path)
+
 
 @router.post("/upload-file")
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), owner_id: str = Form(...), workspace_id: str = Form(...)):
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    owner_id: str = Form(...),
+    workspace_id: str = Form(...),
+    openai_client: openai.AsyncOpenAI = Depends(get_openai_client),
+    supabase: Client = Depends(get_supabase_client),
+    docling_pool: Executor = Depends(get_docling_pool),
+    answer_cache: SemanticCache = Depends(get_answer_cache)
+):
     """
     Upload a file to Supabase storage and create a media record
     """
+    temp_file_path = None
     try:
         # Ensure the user is authenticated
         if not owner_id:
@@ -95,17 +199,13 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
         file_ext = os.path.splitext(file.filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_ext}"
         
-        # Read file content
-        content = await file.read()
+        # Stream file content to a temp file instead of reading it into memory
+        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext, dir=TEMP_FILES_DIR) as temp_file:
+            temp_file_path = temp_file.name
+            while chunk := await file.read(UPLOAD_READ_SIZE):
+                temp_file.write(chunk)
         
-        # Upload to Supabase storage
         storage_path = f"uploads/{unique_filename}"
-        upload_result = supabase.storage.from_(STORAGE_BUCKET).upload(
-            storage_path,
-            content
-        )
-        
-        # Create media record
         media_data = {
             'name': unique_filename,
             'original_name': file.filename,  # Ensure this column exists in the database
@@ -114,7 +214,15 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
             'storage_path': storage_path
         }
         
-        media_result = supabase.table('media').insert(media_data).execute()
+        def upload_to_storage():
+            with open(temp_file_path, 'rb') as upload_file_handle:
+                return supabase.storage.from_(STORAGE_BUCKET).upload(storage_path, upload_file_handle)
+        
+        # Upload to Supabase storage
+        await sb(upload_to_storage)
+        
+        # Create media record
+        media_result = await sb(lambda: supabase.table('media').insert(media_data).execute())
         
         if not media_result.data:
             raise HTTPException(status_code=500, detail="Failed to create media record")
@@ -126,13 +234,23 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
             'workspace_id': workspace_id
         }
 
-        mapping_result = supabase.table('media_workspace_mapping').insert(mapping_data).execute()
+        mapping_result = await sb(lambda: supabase.table('media_workspace_mapping').insert(mapping_data).execute())
         
         if not mapping_result.data:
             raise HTTPException(status_code=500, detail="Failed to create media workspace mapping record")
         
-        # Trigger background processing of chunks
-        background_tasks.add_task(background_process_chunks, storage_path)
+        # Trigger background processing of chunks from the local copy; the task removes the temp file
+        background_tasks.add_task(
+            background_process_chunks,
+            storage_path,
+            temp_file_path,
+            media_id,
+            workspace_id,
+            openai_client,
+            supabase,
+            docling_pool,
+            answer_cache
+        )
 
         return {
             "success": True,
@@ -142,11 +260,20 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
         
     except Exception as e:
         print(f"Error uploading file: {str(e)}")
+        # The background task owns the temp file only once it has been scheduled
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/process-chunks", response_model=ProcessChunkResponse)
-async def process_chunks(request: ProcessChunkRequest):
+async def process_chunks(
+    request: ProcessChunkRequest,
+    openai_client: openai.AsyncOpenAI = Depends(get_openai_client),
+    supabase: Client = Depends(get_supabase_client),
+    docling_pool: Executor = Depends(get_docling_pool),
+    answer_cache: SemanticCache = Depends(get_answer_cache)
+):
     """
     Process a document by splitting it into chunks and creating embeddings
     """
@@ -157,7 +284,7 @@ async def process_chunks(request: ProcessChunkRequest):
         
         # Get file data from storage
         try:
-            file_result = supabase.storage.from_(STORAGE_BUCKET).download(request.fileName)
+            file_result = await sb(lambda: supabase.storage.from_(STORAGE_BUCKET).download(request.fileName))
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Failed to download file: {str(e)}")
         
@@ -166,7 +293,7 @@ async def process_chunks(request: ProcessChunkRequest):
         
         # Get media info from database based on filename
         file_name_only = os.path.basename(request.fileName)
-        media_result = supabase.table('media').select('id, media_type, owner_id').eq('name', file_name_only).execute()
+        media_result = await sb(lambda: supabase.table('media').select('id, media_type, owner_id').eq('name', file_name_only).execute())
         
         if not media_result.data or len(media_result.data) == 0:
             raise HTTPException(status_code=404, detail="Media record not found")
@@ -179,59 +306,18 @@ async def process_chunks(request: ProcessChunkRequest):
         print(f"Processing file: {request.fileName}")
         
         # Save file to temp location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as temp_file:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}", dir=TEMP_FILES_DIR) as temp_file:
             temp_file_path = temp_file.name
             temp_file.write(file_result)
         
         try:
-            # Process document using Docling
-            doc_result = await process_document_with_docling(temp_file_path, file_ext)
-            
-            if "error" in doc_result:
-                raise HTTPException(status_code=500, detail=doc_result["error"])
-            
-            # Split text into chunks
-            chunks = split_into_chunks(doc_result["text"])
-            
-            # Create embeddings and store in database
-            results = []
-            
-            for chunk in chunks:
-                # Create embedding
-                embedding = await create_embedding(chunk["text"], openai_client)
-
-                # Store chunk and embedding in database without metadata
-                chunk_data = {
-                    'chunk_text': chunk["text"],
-                    'media_id': media_id,
-                    'page_number': None,  # Set to None if not used
-                    'embedding': json.dumps(embedding)
-                    # Removed 'metadata' field
-                }
-                
-                chunk_result = supabase.table('chunks').insert(chunk_data).execute()
-                
-                if not chunk_result.data or len(chunk_result.data) == 0:
-                    raise HTTPException(status_code=500, detail="Failed to store chunk")
-                
-                chunk_id = chunk_result.data[0]['id']
-                results.append(ChunkResult(
-                    chunkId=chunk_id,
-                    pageNumber=None,  # Set to None if not used
-                    metadata=ChunkMetadata()  # Empty metadata
-                ))
-            
-            return ProcessChunkResponse(
-                success=True,
-                chunks=len(results),
-                results=results,
-                tables=[TableData(**table) for table in doc_result["tables"]],
-                figures=[FigureData(**figure) for figure in doc_result["figures"]],
-                structure=DocumentStructure(**doc_result["structure"]),
-                note="Document processed successfully with structure preservation"
-            )
+            return await _process_from_path(temp_file_path, media_id, file_ext, openai_client, supabase, docling_pool)
             
         finally:
+            # Cached answers for the media's workspaces predate the new chunks
+            for workspace_id in await _media_workspace_ids(supabase, media_id):
+                answer_cache.invalidate(workspace_id)
+            
             # Clean up temp file
             print(f"Finished processing file: {request.fileName}")
             if os.path.exists(temp_file_path):
@@ -242,12 +328,12 @@ async def process_chunks(request: ProcessChunkRequest):
 
 
 @router.get("/chunks/{media_id}")
-async def get_chunks(media_id: str):
+async def get_chunks(media_id: str, supabase: Client = Depends(get_supabase_client)):
     """
     Get all chunks for a specific media file
     """
     try:
-        result = supabase.table('chunks').select('*').eq('media_id', media_id).execute()
+        result = await sb(lambda: supabase.table('chunks').select('*').eq('media_id', media_id).execute())
         
         if not result.data:
             return {"chunks": []}
@@ -259,8 +345,9 @@ async def get_chunks(media_id: str):
                 "id": chunk["id"],
                 "text": chunk["chunk_text"],
                 "page_number": chunk["page_number"],
-                "metadata": json.loads(chunk["metadata"]) if chunk.get("metadata") else {},
-                "embedding": json.loads(chunk["embedding"]) if chunk.get("embedding") else []
+                "metadata": orjson.loads(chunk["metadata"]) if chunk.get("metadata") else {},
+                # pgvector returns vectors in their '[x,y,...]' text form
+                "embedding": orjson.loads(chunk["embedding"]) if chunk.get("embedding") else []
             }
             processed_chunks.append(chunk_data)
             
@@ -271,29 +358,40 @@ async def get_chunks(media_id: str):
 
 
 @router.delete("/media/{media_id}")
-async def delete_media(media_id: str):
+async def delete_media(
+    media_id: str,
+    supabase: Client = Depends(get_supabase_client),
+    answer_cache: SemanticCache = Depends(get_answer_cache)
+):
     """
     Delete a media file and its associated chunks
     """
     try:
         # Get media info
-        media_result = supabase.table('media').select('*').eq('id', media_id).single().execute()
+        media_result = await sb(lambda: supabase.table('media').select('*').eq('id', media_id).single().execute())
         
         if not media_result.data:
             raise HTTPException(status_code=404, detail="Media not found")
+        
+        # Look up the workspaces while the media record still exists
+        workspace_ids = await _media_workspace_ids(supabase, media_id)
             
         # Delete from storage
         storage_path = media_result.data['storage_path']
         try:
-            supabase.storage.from_(STORAGE_BUCKET).remove([storage_path])
+            await sb(lambda: supabase.storage.from_(STORAGE_BUCKET).remove([storage_path]))
         except Exception as e:
             print(f"Warning: Failed to delete file from storage: {str(e)}")
             
         # Delete chunks
-        supabase.table('chunks').delete().eq('media_id', media_id).execute()
+        await sb(lambda: supabase.table('chunks').delete().eq('media_id', media_id).execute())
         
         # Delete media record
-        supabase.table('media').delete().eq('id', media_id).execute()
+        await sb(lambda: supabase.table('media').delete().eq('id', media_id).execute())
+        
+        # Cached answers may cite the deleted chunks
+        for workspace_id in workspace_ids:
+            answer_cache.invalidate(workspace_id)
         
         return {"success": True, "message": "Media and associated data deleted successfully"}
         
@@ -0,0 +1,85 @@
+import asyncio
+import httpx
+import openai
+from fastapi import Request
+from supabase import create_client, Client
+
+from app.utils.config import (
+    OPENAI_API_KEY, SUPABASE_URL, SUPABASE_ANON_KEY, DOCLING_WORKERS,
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_PATH
+)
+from app.utils.docling_pool import DoclingPool
+from app.utils.semantic_cache import SemanticCache
+from app.utils.text_processing import init_docling_worker
+
+
+def create_openai_client() -> openai.AsyncOpenAI:
+    """
+    Create the app-wide OpenAI client.
+    Uses a pooled HTTP/2 connection so concurrent requests share keep-alive connections.
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+
+def create_supabase_client() -> Client:
+    """
+    Create the app-wide Supabase client.
+    """
+    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+
+def create_docling_pool() -> DoclingPool:
+    """
+    Create the process pool used for Docling conversion.
+    """
+    return DoclingPool(max_workers=DOCLING_WORKERS, initializer=init_docling_worker)
+
+
+def create_answer_cache() -> SemanticCache:
+    """
+    Create the semantic cache of chat answers, restoring any saved entries.
+    """
+    cache = SemanticCache(dim=SEMANTIC_CACHE_DIM, max_entries=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL)
+    cache.load(SEMANTIC_CACHE_PATH)
+    return cache
+
+
+async def sb(query_fn):
+    """
+    Run a blocking Supabase call in a worker thread so it doesn't block the event loop.
+    
+    Usage: await sb(lambda: supabase.table('chunks').select('*').execute())
+    """
+    return await asyncio.to_thread(query_fn)
+
+
+def get_openai_client(request: Request) -> openai.AsyncOpenAI:
+    """
+    Dependency returning the OpenAI client stored on app.state.
+    """
+    return request.app.state.openai
+
+
+def get_supabase_client(request: Request) -> Client:
+    """
+    Dependency returning the Supabase client stored on app.state.
+    """
+    return request.app.state.supabase
+
+
+def get_docling_pool(request: Request) -> DoclingPool:
+    """
+    Dependency returning the Docling process pool stored on app.state.
+    """
+    return request.app.state.docling_pool
+
+
+def get_answer_cache(request: Request) -> SemanticCache:
+    """
+    Dependency returning the chat answer cache stored on app.state.
+    """
+    return request.app.state.answer_cache
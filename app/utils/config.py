@@ -7,10 +7,32 @@ load_dotenv()
 # OpenAI API configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Maximum number of embedding requests per minute for the OpenAI account tier
+OPENAI_MAX_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_MAX_REQUESTS_PER_MINUTE", "3500"))
+
+# Maximum number of embedding requests in flight per document
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "5"))
+
+# Number of query embeddings kept in the in-process cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+# Semantic cache of chat answers
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 
+# Maximum number of chunk rows sent in one insert request
+CHUNK_INSERT_BATCH_SIZE = int(os.getenv("CHUNK_INSERT_BATCH_SIZE", "500"))
+
+# Number of processes used for Docling document conversion
+DOCLING_WORKERS = int(os.getenv("DOCLING_WORKERS", str(os.cpu_count() or 1)))
+
 # Storage configuration
 TEMP_FILES_DIR = os.getenv("TEMP_FILES_DIR", "/tmp")
-STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "media-bucket") 
\ No newline at end of file
+STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "media-bucket")
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(TEMP_FILES_DIR, "semantic_cache.npz")) 
\ No newline at end of file
@@ -0,0 +1,43 @@
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class DoclingPool(Executor):
+    """
+    Process pool for Docling conversion that replaces itself when a worker dies.
+
+    A worker killed mid-conversion (e.g. by the OOM killer on a large PDF) marks a
+    ProcessPoolExecutor as broken for good, failing every later submit. The
+    conversions in flight at the time still fail, but the next submit starts a
+    fresh pool instead of failing until the service is restarted.
+    """
+
+    def __init__(self, max_workers: int, initializer=None):
+        self._max_workers = max_workers
+        self._initializer = initializer
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Workers are spawned rather than forked so torch state is not inherited
+        return ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self._initializer,
+        )
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            try:
+                return self._executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                print("Warning: Docling worker pool is broken, starting a new one")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+                return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
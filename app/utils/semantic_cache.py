@@ -0,0 +1,186 @@
+import os
+import time
+import tempfile
+from typing import List, Optional
+import numpy as np
+import orjson
+
+
+class SemanticCache:
+    """
+    In-process cache of chat responses keyed by query embedding.
+
+    Entries live in a row-normalized matrix, so a lookup is a single
+    matrix-vector product. Once max_entries is reached the oldest entries are
+    overwritten, and entries older than ttl seconds are ignored.
+
+    Rows are scalar-quantized to int8 with a per-row scale, a quarter of the
+    float32 footprint. Similarities are accumulated in int32 and rescaled, which
+    keeps the error around 1e-3, well below the gap between hits and misses.
+
+    Only the first dim components of each embedding are kept. text-embedding-3
+    models are trained so that a truncated, renormalized prefix is itself a
+    valid embedding (the same vector the API returns for dimensions=dim), which
+    preserves similarity ranking while shrinking memory and scan cost.
+    """
+
+    def __init__(self, dim: int = 256, max_entries: int = 5000, ttl: float = 3600):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._size = 0
+        self._next = 0
+        self._codes = np.zeros((0, dim), dtype=np.int8)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._timestamps = np.zeros(0, dtype=np.float64)
+        self._workspace_ids = np.zeros(0, dtype=object)
+        self._payloads: List[Optional[dict]] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _normalize(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)[:self.dim]
+        return vector / np.linalg.norm(vector)
+
+    def _quantize(self, embedding):
+        vector = self._normalize(embedding)
+        scale = np.max(np.abs(vector)) / 127 or 1.0
+        return np.round(vector / scale).astype(np.int8), np.float32(scale)
+
+    def _grow(self):
+        capacity = min(self.max_entries, max(16, 2 * len(self._codes)))
+        extra = capacity - len(self._codes)
+        self._codes = np.concatenate([self._codes, np.zeros((extra, self.dim), dtype=np.int8)])
+        self._scales = np.concatenate([self._scales, np.zeros(extra, dtype=np.float32)])
+        self._timestamps = np.concatenate([self._timestamps, np.zeros(extra, dtype=np.float64)])
+        self._workspace_ids = np.concatenate([self._workspace_ids, np.zeros(extra, dtype=object)])
+        self._payloads.extend([None] * extra)
+
+    def lookup(self, embedding, workspace_id: str, threshold: float) -> Optional[dict]:
+        """
+        Return the cached payload for the most similar query in the workspace.
+
+        Args:
+            embedding: Query embedding
+            workspace_id: Workspace the query belongs to
+            threshold: Minimum cosine similarity for a hit
+
+        Returns:
+            Cached payload, or None on a miss
+        """
+        if self._size == 0:
+            return None
+
+        query_codes, query_scale = self._quantize(embedding)
+        dots = self._codes[:self._size].astype(np.int32) @ query_codes.astype(np.int32)
+        similarities = dots * self._scales[:self._size] * query_scale
+
+        # Only consider fresh entries from the same workspace
+        valid = (self._workspace_ids[:self._size] == workspace_id) & (
+            self._timestamps[:self._size] >= time.time() - self.ttl
+        )
+        similarities = np.where(valid, similarities, -np.inf)
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+        return self._payloads[best]
+
+    def add(self, embedding, workspace_id: str, payload: dict):
+        """
+        Store a payload for a query embedding, evicting the oldest entry when full.
+
+        Args:
+            embedding: Query embedding
+            workspace_id: Workspace the query belongs to
+            payload: JSON-serializable response to return on later hits
+        """
+        if self._size < self.max_entries:
+            if self._size == len(self._codes):
+                self._grow()
+            index = self._size
+            self._size += 1
+        else:
+            index = self._next
+            self._next = (self._next + 1) % self.max_entries
+
+        self._codes[index], self._scales[index] = self._quantize(embedding)
+        self._timestamps[index] = time.time()
+        self._workspace_ids[index] = workspace_id
+        self._payloads[index] = payload
+
+    def invalidate(self, workspace_id: str):
+        """
+        Drop every entry for a workspace, e.g. after its documents change.
+        Entries are expired in place and their slots reused as the ring advances.
+
+        Args:
+            workspace_id: Workspace whose cached answers are stale
+        """
+        stale = self._workspace_ids[:self._size] == workspace_id
+        self._timestamps[:self._size][stale] = 0
+        for index in np.flatnonzero(stale):
+            self._payloads[index] = None
+
+    def save(self, path: str):
+        """
+        Persist the cache to an .npz file.
+        Writes to a temp file and renames it into place, so concurrent workers
+        saving to the same path never leave a partially written file.
+        """
+        path = _npz_path(path)
+        directory = os.path.dirname(path) or "."
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as temp_file:
+            temp_file_path = temp_file.name
+            np.savez(
+                temp_file,
+                codes=self._codes[:self._size],
+                scales=self._scales[:self._size],
+                timestamps=self._timestamps[:self._size],
+                workspace_ids=np.array(self._workspace_ids[:self._size], dtype=str),
+                payloads=np.array([orjson.dumps(payload).decode() for payload in self._payloads[:self._size]], dtype=str),
+                next=self._next
+            )
+        os.replace(temp_file_path, path)
+
+    def load(self, path: str):
+        """
+        Restore the cache from an .npz file written by save, if it exists.
+        An unreadable or incompatible file is skipped and the cache starts empty.
+        """
+        path = _npz_path(path)
+        if not os.path.exists(path):
+            return
+
+        try:
+            with np.load(path) as data:
+                if "codes" not in data.files or data["codes"].shape[1] != self.dim:
+                    return
+
+                size = min(len(data["codes"]), self.max_entries)
+                codes = data["codes"][:size]
+                scales = data["scales"][:size]
+                timestamps = data["timestamps"][:size]
+                workspace_ids = data["workspace_ids"][:size].tolist()
+                payloads = [orjson.loads(str(payload)) for payload in data["payloads"][:size]]
+                next_index = int(data["next"]) % self.max_entries
+        except Exception as e:
+            print(f"Warning: Failed to load semantic cache from {path}: {str(e)}")
+            return
+
+        while len(self._codes) < size:
+            self._grow()
+
+        self._codes[:size] = codes
+        self._scales[:size] = scales
+        self._timestamps[:size] = timestamps
+        self._workspace_ids[:size] = workspace_ids
+        self._payloads[:size] = payloads
+        self._size = size
+        self._next = next_index
+
+
+def _npz_path(path: str) -> str:
+    # np.savez appends .npz to bare paths, so normalize it for both save and load
+    return path if path.endswith(".npz") else f"{path}.npz"
@@ -1,20 +1,59 @@
 import re
 from typing import List, Optional
-from docling.document_converter import DocumentConverter
-from docling.chunking import HybridChunker
 import os
 import json
+import asyncio
+import random
+import hashlib
+import functools
+from collections import OrderedDict
+from concurrent.futures import Executor
+import openai
+import tiktoken
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+from app.utils.config import EMBED_CONCURRENCY, EMBEDDING_CACHE_SIZE, OPENAI_MAX_REQUESTS_PER_MINUTE
+
+# OpenAI embedding model and per-request limits
+EMBEDDING_MODEL = "text-embedding-3-small"
+MAX_EMBEDDING_INPUTS = 2048
+MAX_EMBEDDING_TOKENS = 250000
+MAX_EMBEDDING_INPUT_TOKENS = 8191
+
+# Process-wide limit on embedding requests, and backoff used when rate limited anyway
+_rate_limiter = AsyncLimiter(OPENAI_MAX_REQUESTS_PER_MINUTE, 60)
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+# Whitespace that follows sentence-ending punctuation
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])(\s+)')
+
+# Docling converter loaded once per process pool worker
+_converter = None
+
+# LRU cache of query embeddings, keyed by SHA-256 of model and text
+_embedding_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
 
 
 def setup_document_converter():
     """
     Set up document converter with advanced processing options
     """
+    # Imported here so only Docling pool workers pay for loading it
+    from docling.document_converter import DocumentConverter
     
     # Create and return converter with options
     return DocumentConverter()
 
 
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """
+    Tokenizer for the embedding model, loaded on first use since it may need to be downloaded.
+    """
+    return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+
+
 def split_into_chunks(text: str, chunk_size: int = 1000) -> list:
     """
     Split text into chunks using a simple approach.
@@ -27,20 +66,28 @@ def split_into_chunks(text: str, chunk_size: int = 1000) -> list:
         List of text chunks
     """
     try:
-        # Fallback to basic sentence splitting
+        # Split on sentence boundaries, keeping each separator so newlines in
+        # Docling's markdown survive, and join once per chunk
+        parts = _SENTENCE_BOUNDARY.split(text.strip())
         chunks = []
-        current_chunk = ''
-        sentences = text.split('.')
+        buffer = []
+        buffer_len = 0
         
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) > chunk_size:
-                chunks.append({"text": current_chunk.strip(), "metadata": {}})
-                current_chunk = sentence
-            else:
-                current_chunk += sentence + '.'
+        for index in range(0, len(parts), 2):
+            separator = parts[index + 1] if index + 1 < len(parts) else ""
+            for piece in _hard_split(parts[index], chunk_size):
+                if buffer and buffer_len + len(piece) > chunk_size:
+                    chunks.append({"text": "".join(buffer).strip(), "metadata": {}})
+                    buffer = []
+                    buffer_len = 0
+                buffer.append(piece)
+                buffer_len += len(piece)
+            if buffer:
+                buffer.append(separator)
+                buffer_len += len(separator)
         
-        if current_chunk:
-            chunks.append({"text": current_chunk.strip(), "metadata": {}})
+        if buffer and "".join(buffer).strip():
+            chunks.append({"text": "".join(buffer).strip(), "metadata": {}})
         
         return chunks
         
@@ -50,9 +97,31 @@ def split_into_chunks(text: str, chunk_size: int = 1000) -> list:
         return [{"text": text, "metadata": {}}]
 
 
-async def process_document_with_docling(file_path: str, file_type: str) -> dict:
+def _hard_split(sentence: str, chunk_size: int) -> list:
+    # Break a sentence longer than chunk_size at the last whitespace in each
+    # window, or mid-word if there is none
+    pieces = []
+    while len(sentence) > chunk_size:
+        cut = sentence.rfind(" ", 1, chunk_size + 1)
+        cut = cut if cut > 0 else chunk_size
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def init_docling_worker():
     """
-    Process document using Docling with simplified features.
+    Process pool initializer that loads the Docling converter once per worker.
+    """
+    global _converter
+    _converter = setup_document_converter()
+
+
+def convert_document(file_path: str, file_type: str) -> dict:
+    """
+    Convert a document with Docling. Runs synchronously, inside a pool worker.
     
     Args:
         file_path: Path to the document file
@@ -62,8 +131,8 @@ async def process_document_with_docling(file_path: str, file_type: str) -> dict:
         Dictionary containing extracted text and metadata
     """
     try:
-        # Set up document converter with advanced options
-        converter = setup_document_converter()
+        # Reuse the worker's converter, or set one up if running outside the pool
+        converter = _converter or setup_document_converter()
         
         # Process the document
         result = converter.convert(file_path)
@@ -81,20 +150,53 @@ async def process_document_with_docling(file_path: str, file_type: str) -> dict:
         }
         
     except Exception as e:
-        print(f"Error processing document with Docling: {str(e)}")
-        return {
-            "error": f"Failed to process document: {str(e)}",
-            "text": "",
-            "metadata": {},
-            "tables": [],
-            "figures": [],
-            "structure": {"headings": [], "sections": []}
-        }
+        return _docling_error(e)
+
+
+async def process_document_with_docling(file_path: str, file_type: str, executor: Executor = None) -> dict:
+    """
+    Process document using Docling with simplified features.
+    Conversion runs in the given executor so the event loop stays responsive.
+    
+    Args:
+        file_path: Path to the document file
+        file_type: Type of the document file
+        executor: Process pool to run the conversion in
+        
+    Returns:
+        Dictionary containing extracted text and metadata
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, convert_document, file_path, file_type)
+        
+    except Exception as e:
+        return _docling_error(e)
+
+
+def _docling_error(e: Exception) -> dict:
+    print(f"Error processing document with Docling: {str(e)}")
+    return {
+        "error": f"Failed to process document: {str(e)}",
+        "text": "",
+        "metadata": {},
+        "tables": [],
+        "figures": [],
+        "structure": {"headings": [], "sections": []}
+    }
+
+
+def _embedding_cache_key(text: str) -> bytes:
+    """
+    Build the embedding cache key for a text, scoped to the embedding model.
+    """
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\0{text}".encode()).digest()
 
 
 async def create_embedding(text: str, openai_client) -> list[float]:
     """
     Create an embedding for the given text using OpenAI.
+    Results are kept in an in-process LRU cache so repeated queries skip the API call.
     
     Args:
         text: The text to create an embedding for
@@ -103,11 +205,128 @@ async def create_embedding(text: str, openai_client) -> list[float]:
     Returns:
         List of embedding values
     """
-    response = await openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text,
-    )
-    return response.data[0].embedding 
+    key = _embedding_cache_key(text)
+    cached = _embedding_cache.get(key)
+    if cached is not None:
+        _embedding_cache.move_to_end(key)
+        return list(cached)
+    
+    embeddings = await create_embeddings([text], openai_client)
+    
+    _embedding_cache[key] = tuple(embeddings[0])
+    if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+    
+    return embeddings[0]
+
+
+def batch_texts(texts: List[str]) -> List[List[str]]:
+    """
+    Group texts into batches that fit a single OpenAI embeddings request.
+    Texts over the per-input token limit are truncated so one long input
+    doesn't get the whole batch rejected.
+    
+    Args:
+        texts: The texts to group
+        
+    Returns:
+        List of batches, each within the input count and token limits
+    """
+    encoding = get_encoding()
+    batches = []
+    current_batch = []
+    current_tokens = 0
+    
+    for text in texts:
+        token_ids = encoding.encode(text)
+        if len(token_ids) > MAX_EMBEDDING_INPUT_TOKENS:
+            text = encoding.decode(token_ids[:MAX_EMBEDDING_INPUT_TOKENS])
+        tokens = min(len(token_ids), MAX_EMBEDDING_INPUT_TOKENS)
+        if current_batch and (
+            len(current_batch) >= MAX_EMBEDDING_INPUTS
+            or current_tokens + tokens > MAX_EMBEDDING_TOKENS
+        ):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = 0
+        current_batch.append(text)
+        current_tokens += tokens
+    
+    if current_batch:
+        batches.append(current_batch)
+    
+    return batches
+
+
+def _wait_retry_after(retry_state) -> float:
+    """
+    Wait as long as the server's Retry-After header asks, or the exponential backoff if longer.
+    """
+    backoff = _backoff(retry_state)
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(float(retry_after), backoff)
+    except (TypeError, ValueError):
+        return backoff
+
+
+@retry(
+    retry=retry_if_exception_type((
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )),
+    wait=_wait_retry_after,
+    stop=stop_after_attempt(6),
+    reraise=True,
+)
+async def _embed_batch(texts: List[str], openai_client) -> List[List[float]]:
+    """
+    Create embeddings for a single batch of texts in one OpenAI request.
+    Requests are rate limited process-wide and retried on 429s, 5xx responses and connection errors.
+    
+    Args:
+        texts: The batch of texts to create embeddings for
+        openai_client: OpenAI client instance
+        
+    Returns:
+        List of embeddings, in the same order as texts
+    """
+    async with _rate_limiter:
+        # Retries are handled by tenacity so they respect Retry-After and the rate limiter
+        response = await openai_client.with_options(max_retries=0).embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts,
+        )
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+
+async def create_embeddings(texts: List[str], openai_client) -> List[List[float]]:
+    """
+    Create embeddings for many texts using as few OpenAI requests as possible.
+    Batches are sent concurrently, up to EMBED_CONCURRENCY at a time.
+    
+    Args:
+        texts: The texts to create embeddings for
+        openai_client: OpenAI client instance
+        
+    Returns:
+        List of embeddings, in the same order as texts
+    """
+    batches = batch_texts(texts)
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+    
+    async def run(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            # Small jitter so concurrent batches don't hit the API at the same instant
+            await asyncio.sleep(random.uniform(0, 0.05))
+            return await _embed_batch(batch, openai_client)
+    
+    # gather preserves input order, so results line up with batches
+    results = await asyncio.gather(*[run(batch) for batch in batches])
+    return [embedding for batch_embeddings in results for embedding in batch_embeddings]
 
 
 async def background_process_chunks(file_name: str):
@@ -0,0 +1,5 @@
+-- Store chunk embeddings as pgvector vectors instead of JSON text
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE chunks
+ALTER COLUMN embedding TYPE vector(1536) USING embedding::text::vector(1536);
@@ -0,0 +1,45 @@
+-- Approximate nearest-neighbour index for cosine similarity search
+CREATE INDEX IF NOT EXISTS chunks_embedding_hnsw ON chunks
+USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Match chunks by ordering on cosine distance so the HNSW index is used.
+-- The threshold is applied to the k nearest rows rather than to the whole table.
+DROP FUNCTION IF EXISTS match_chunks(vector, float, int);
+
+CREATE OR REPLACE FUNCTION match_chunks(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int
+)
+RETURNS TABLE (
+    id uuid,
+    chunk_text text,
+    media_id uuid,
+    page_number integer,
+    similarity float,
+    media jsonb
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        nearest.id,
+        nearest.chunk_text,
+        nearest.media_id,
+        nearest.page_number,
+        1 - nearest.distance AS similarity,
+        jsonb_build_object('name', media.name) AS media
+    FROM (
+        SELECT
+            chunks.id,
+            chunks.chunk_text,
+            chunks.media_id,
+            chunks.page_number,
+            chunks.embedding <=> query_embedding AS distance
+        FROM chunks
+        ORDER BY chunks.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    LEFT JOIN media ON media.id = nearest.media_id
+    WHERE 1 - nearest.distance > match_threshold
+    ORDER BY nearest.distance;
+$$;
@@ -0,0 +1,53 @@
+-- Filter match_chunks by workspace inside the database so match_count results
+-- all belong to the workspace. A NULL workspace searches every chunk.
+DROP FUNCTION IF EXISTS match_chunks(vector, float, int);
+
+CREATE OR REPLACE FUNCTION match_chunks(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int,
+    p_workspace_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    chunk_text text,
+    media_id uuid,
+    page_number integer,
+    similarity float,
+    media jsonb
+)
+LANGUAGE sql STABLE
+-- Widen the HNSW candidate list; on its own this does not guarantee match_count
+-- in-workspace rows (see 05_match_chunks_iterative_scan.sql)
+SET hnsw.ef_search = 64
+AS $$
+    SELECT
+        nearest.id,
+        nearest.chunk_text,
+        nearest.media_id,
+        nearest.page_number,
+        1 - nearest.distance AS similarity,
+        jsonb_build_object('name', media.name) AS media
+    FROM (
+        SELECT
+            chunks.id,
+            chunks.chunk_text,
+            chunks.media_id,
+            chunks.page_number,
+            chunks.embedding <=> query_embedding AS distance
+        FROM chunks
+        WHERE p_workspace_id IS NULL
+           OR chunks.media_id IN (
+               SELECT media_workspace_mapping.media_id
+               FROM media_workspace_mapping
+               WHERE media_workspace_mapping.workspace_id = p_workspace_id
+           )
+        ORDER BY chunks.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    JOIN media ON media.id = nearest.media_id
+    WHERE 1 - nearest.distance > match_threshold
+    ORDER BY nearest.distance;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_media_workspace_mapping_workspace_id ON media_workspace_mapping(workspace_id);
@@ -0,0 +1,53 @@
+-- The workspace filter is applied after the HNSW index scan, which only returns
+-- hnsw.ef_search candidates. For a workspace holding a small share of the chunks
+-- that leaves fewer than match_count rows, often none. Iterative index scans
+-- (pgvector >= 0.8) keep scanning the index, still in distance order, until
+-- match_count filtered rows are found or hnsw.max_scan_tuples (20000 by default)
+-- tuples have been visited. A workspace holding a very small share of the
+-- chunks can therefore still get fewer rows, but far fewer than before.
+CREATE OR REPLACE FUNCTION match_chunks(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int,
+    p_workspace_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    chunk_text text,
+    media_id uuid,
+    page_number integer,
+    similarity float,
+    media jsonb
+)
+LANGUAGE sql STABLE
+SET hnsw.ef_search = 64
+SET hnsw.iterative_scan = strict_order
+AS $$
+    SELECT
+        nearest.id,
+        nearest.chunk_text,
+        nearest.media_id,
+        nearest.page_number,
+        1 - nearest.distance AS similarity,
+        jsonb_build_object('name', media.name) AS media
+    FROM (
+        SELECT
+            chunks.id,
+            chunks.chunk_text,
+            chunks.media_id,
+            chunks.page_number,
+            chunks.embedding <=> query_embedding AS distance
+        FROM chunks
+        WHERE p_workspace_id IS NULL
+           OR chunks.media_id IN (
+               SELECT media_workspace_mapping.media_id
+               FROM media_workspace_mapping
+               WHERE media_workspace_mapping.workspace_id = p_workspace_id
+           )
+        ORDER BY chunks.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    JOIN media ON media.id = nearest.media_id
+    WHERE 1 - nearest.distance > match_threshold
+    ORDER BY nearest.distance;
+$$;
@@ -0,0 +1,17 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.utils.docling_pool import DoclingPool
+
+
+def test_docling_pool_recovers_after_worker_dies():
+    pool = DoclingPool(max_workers=1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result(timeout=60)
+
+        assert pool.submit(pow, 2, 3).result(timeout=60) == 8
+    finally:
+        pool.shutdown()
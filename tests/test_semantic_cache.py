@@ -0,0 +1,47 @@
+import numpy as np
+
+from app.utils.semantic_cache import SemanticCache
+
+
+def test_save_and_load_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(3, 1536))
+
+    cache = SemanticCache(dim=256, max_entries=10)
+    for i, embedding in enumerate(embeddings):
+        cache.add(embedding, "workspace", {"answer": f"answer {i}", "context_sources": []})
+
+    # A path without the extension is saved and loaded from the same file
+    path = str(tmp_path / "semantic_cache")
+    cache.save(path)
+
+    restored = SemanticCache(dim=256, max_entries=10)
+    restored.load(path)
+
+    assert len(restored) == 3
+    assert restored.lookup(embeddings[1], "workspace", 0.99) == {"answer": "answer 1", "context_sources": []}
+    assert restored.lookup(embeddings[1], "other-workspace", 0.99) is None
+
+
+def test_load_skips_corrupt_file(tmp_path):
+    path = tmp_path / "semantic_cache.npz"
+    path.write_bytes(b"not a zip file")
+
+    cache = SemanticCache(dim=256, max_entries=10)
+    cache.load(str(path))
+
+    assert len(cache) == 0
+
+
+def test_invalidate_drops_only_that_workspace():
+    rng = np.random.default_rng(1)
+    embedding = rng.normal(size=1536)
+
+    cache = SemanticCache(dim=256, max_entries=10)
+    cache.add(embedding, "workspace", {"answer": "stale"})
+    cache.add(embedding, "other-workspace", {"answer": "kept"})
+
+    cache.invalidate("workspace")
+
+    assert cache.lookup(embedding, "workspace", 0.99) is None
+    assert cache.lookup(embedding, "other-workspace", 0.99) == {"answer": "kept"}
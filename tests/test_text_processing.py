@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+from aiolimiter import AsyncLimiter
+
+from app.utils import text_processing
+from app.utils.text_processing import _embed_batch
+
+
+def _embeddings_response() -> httpx.Response:
+    # Return embeddings out of order to check they are sorted by index
+    return httpx.Response(200, json={
+        "object": "list",
+        "model": "text-embedding-3-small",
+        "data": [
+            {"object": "embedding", "index": 1, "embedding": [0.0, 1.0]},
+            {"object": "embedding", "index": 0, "embedding": [1.0, 0.0]},
+        ],
+        "usage": {"prompt_tokens": 2, "total_tokens": 2},
+    })
+
+
+@pytest.mark.parametrize("error_response", [
+    httpx.Response(429, headers={"retry-after": "0"}, json={"error": {"message": "Rate limited"}}),
+    httpx.Response(503, json={"error": {"message": "Service unavailable"}}),
+])
+def test_embed_batch_retries_then_succeeds(error_response, monkeypatch):
+    # The limiter binds to an event loop, so give each asyncio.run its own
+    monkeypatch.setattr(text_processing, "_rate_limiter", AsyncLimiter(1000, 60))
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return error_response
+        return _embeddings_response()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            client = openai.AsyncOpenAI(api_key="test", http_client=http_client)
+            return await _embed_batch(["first", "second"], client)
+
+    embeddings = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert embeddings == [[1.0, 0.0], [0.0, 1.0]]
+
+
+class _CharEncoding:
+    # One token per character, so limits are easy to reason about without downloading tiktoken data
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def decode(self, tokens):
+        return "".join(chr(t) for t in tokens)
+
+
+def test_batch_texts_truncates_over_long_inputs(monkeypatch):
+    monkeypatch.setattr(text_processing, "get_encoding", lambda: _CharEncoding())
+    long_text = "x" * (text_processing.MAX_EMBEDDING_INPUT_TOKENS + 100)
+
+    batches = text_processing.batch_texts(["short", long_text])
+
+    assert batches == [["short", "x" * text_processing.MAX_EMBEDDING_INPUT_TOKENS]]
+
+
+def test_split_into_chunks_respects_chunk_size_and_newlines():
+    text = "# Title.\n\nFirst sentence here. " + "word " * 60 + "end.\nLast line."
+
+    chunks = [chunk["text"] for chunk in text_processing.split_into_chunks(text, chunk_size=50)]
+
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert chunks[0] == "# Title.\n\nFirst sentence here."
+    assert chunks[-1].endswith("end.\nLast line.")
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_create_embedding_cache_hit_matches_miss(monkeypatch):
+    calls = []
+
+    async def fake_create_embeddings(texts, openai_client):
+        calls.append(texts)
+        return [[0.1, 0.2, 0.3]]
+
+    monkeypatch.setattr(text_processing, "create_embeddings", fake_create_embeddings)
+    monkeypatch.setattr(text_processing, "_embedding_cache", text_processing.OrderedDict())
+
+    miss = asyncio.run(text_processing.create_embedding("hello", None))
+    hit = asyncio.run(text_processing.create_embedding("hello", None))
+
+    assert miss == hit == [0.1, 0.2, 0.3]
+    assert len(calls) == 1